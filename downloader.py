@@ -2,6 +2,13 @@
 # Take SeedVR2-3B as an example.
 # See all models: https://huggingface.co/models?other=seedvr
 
+import importlib.util
+import os
+
+# Use the rust download backend when it is installed, must be set before importing the hub.
+if importlib.util.find_spec("hf_transfer") is not None:
+    os.environ.setdefault("HF_HUB_ENABLE_HF_TRANSFER", "1")
+
 from huggingface_hub import snapshot_download
 
 save_dir = "ckpts/"
@@ -11,7 +18,7 @@ cache_dir = save_dir + "/cache"
 snapshot_download(cache_dir=cache_dir,
   local_dir=save_dir,
   repo_id=repo_id,
-  local_dir_use_symlinks=False,
   resume_download=True,
+  max_workers=8,
   allow_patterns=["*.json", "*.safetensors", "*.pth", "*.bin", "*.py", "*.md", "*.txt"],
 )
@@ -1324,6 +1324,7 @@ class VideoAutoencoderKLWrapper(VideoAutoencoderKL):
         *,
         split_size: Optional[int],
         memory_device: _memory_device_t,
+        memory_dtype: Optional[str] = None,
     ):
         assert (
             split_size is None or memory_device is not None
@@ -1337,6 +1338,7 @@ class VideoAutoencoderKLWrapper(VideoAutoencoderKL):
         for module in self.modules():
             if isinstance(module, InflatedCausalConv3d):
                 module.set_memory_device(memory_device)
+                module.set_memory_dtype(memory_dtype)
 
     def set_memory_limit(self, conv_max_mem: Optional[float], norm_max_mem: Optional[float]):
         set_norm_limit(norm_max_mem)
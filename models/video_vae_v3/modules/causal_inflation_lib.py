@@ -12,14 +12,13 @@
 # // See the License for the specific language governing permissions and
 # // limitations under the License.
 
+import itertools
 import math
-from contextlib import contextmanager
 from typing import List, Optional, Union
 import torch
 import torch.distributed as dist
 import torch.nn.functional as F
 from diffusers.models.normalization import RMSNorm
-from einops import rearrange
 from torch import Tensor, nn
 from torch.nn import Conv3d
 
@@ -31,21 +30,70 @@ from common.distributed.advanced import (
     get_sequence_parallel_world_size,
 )
 from common.logger import get_logger
-from models.video_vae_v3.modules.context_parallel_lib import cache_send_recv, get_cache_size
+from models.video_vae_v3.modules.context_parallel_lib import (
+    cache_send_recv,
+    get_cache_size,
+    get_output_len,
+)
 from models.video_vae_v3.modules.global_config import get_norm_limit
 from models.video_vae_v3.modules.types import MemoryState, _inflation_mode_t, _memory_device_t
 
 logger = get_logger(__name__)
 
+_MEMORY_STREAMS = {}
+
+
+def _get_memory_stream(device: torch.device) -> torch.cuda.Stream:
+    """
+    Side stream for offloading conv memory to host, shared by all layers on the device.
+    """
+    if device not in _MEMORY_STREAMS:
+        _MEMORY_STREAMS[device] = torch.cuda.Stream(device)
+    return _MEMORY_STREAMS[device]
+
+
+def _conv_output_shape(conv_module, in_shape) -> torch.Size:
+    """
+    Output shape of `conv_module` for an input that is already concatenated & padded.
+    """
+    output_shape = [in_shape[0], conv_module.out_channels]
+    for dim in range(2, len(in_shape)):
+        output_shape.append(get_output_len(conv_module, in_shape[dim], pad_len=0, dim=dim - 2))
+    return torch.Size(output_shape)
 
-@contextmanager
-def ignore_padding(model):
-    orig_padding = model.padding
-    model.padding = (0, 0, 0)
-    try:
-        yield
-    finally:
-        model.padding = orig_padding
+
+def _cat_pad(tensors: List[Tensor], dim: int, padding) -> Tensor:
+    """
+    Same as `F.pad(torch.cat(tensors, dim), padding)`, but written into a single buffer
+    so the concatenated input is not copied a second time for padding.
+    """
+    if len(tensors) == 1 and not any(padding):
+        return tensors[0]
+    shape = list(tensors[0].size())
+    shape[dim] = sum(t.size(dim) for t in tensors)
+    for i, (lpad, rpad) in enumerate(zip(padding[0::2], padding[1::2])):
+        shape[-1 - i] += lpad + rpad
+    out = torch.empty(
+        shape,
+        dtype=tensors[0].dtype,
+        device=tensors[0].device,
+        memory_format=torch.channels_last_3d,
+    )
+
+    # Zero the padded borders only, then copy the inputs into the inner region.
+    inner = out
+    for i, (lpad, rpad) in enumerate(zip(padding[0::2], padding[1::2])):
+        pad_dim = out.ndim - 1 - i
+        if lpad > 0:
+            out.narrow(pad_dim, 0, lpad).zero_()
+        if rpad > 0:
+            out.narrow(pad_dim, out.size(pad_dim) - rpad, rpad).zero_()
+        inner = inner.narrow(pad_dim, lpad, inner.size(pad_dim) - lpad - rpad)
+    offset = 0
+    for t in tensors:
+        inner.narrow(dim, offset, t.size(dim)).copy_(t)
+        offset += t.size(dim)
+    return out
 
 
 class InflatedCausalConv3d(Conv3d):
@@ -61,16 +109,75 @@ class InflatedCausalConv3d(Conv3d):
         super().__init__(*args, **kwargs)
         self.temporal_padding = self.padding[0]
         self.memory_device = memory_device
+        self.memory_dtype = None  # Optional lower precision for memory offloaded to cpu.
         self.padding = (0, *self.padding[1:])  # Remove temporal pad to keep causal.
+        # F.pad style padding for `memory_limit_conv`.
+        self.slicing_padding = tuple(x for x in reversed(self.padding) for _ in range(2))
         self.memory_limit = float("inf")
+        self.tile_plans = {}  # Cached `plan_tiles` results, keyed by input geometry.
+        self.memory_buffer = None  # Pinned host buffer for offloaded memory.
+        self.memory_event = None  # Pending offload of memory into memory_buffer.
+        # NDHWC weights let cudnn pick its channels-last (tensor core friendly) conv kernels.
+        self.weight.data = self.weight.data.contiguous(memory_format=torch.channels_last_3d)
 
     def set_memory_limit(self, value: float):
         self.memory_limit = value
+        self.tile_plans = {}
 
     def set_memory_device(self, memory_device: _memory_device_t):
         self.memory_device = memory_device
 
-    def memory_limit_conv(
+    def set_memory_dtype(self, memory_dtype: Optional[Union[str, torch.dtype]]):
+        if isinstance(memory_dtype, str):
+            memory_dtype = getattr(torch, memory_dtype, memory_dtype)
+        # fp8 would need per-tensor scaling to not overflow, so only 16/32 bit floats.
+        assert memory_dtype is None or memory_dtype in (
+            torch.float32,
+            torch.float16,
+            torch.bfloat16,
+        ), f"Unsupported memory_dtype: {memory_dtype}"
+        self.memory_dtype = memory_dtype
+
+    def _offload_memory(self):
+        """
+        Move memory to host, cast to `memory_dtype` if set (it's upcast again when read).
+        On cuda, the copy runs on a side stream into pinned memory to overlap with
+        the following convs; `forward` waits for it before reading memory.
+        """
+        dtype = self.memory_dtype or self.memory.dtype
+        if not self.memory.is_cuda:
+            self.memory = self.memory.to("cpu", dtype, copy=True)
+            return
+        # Memory may be a strided view, keep the layout of channels-last conv outputs so
+        # the copy below stays a single memcpy without a contiguous copy on device.
+        memory_format = torch.contiguous_format
+        if self.memory.ndim == 5 and self.memory.is_contiguous(
+            memory_format=torch.channels_last_3d
+        ):
+            memory_format = torch.channels_last_3d
+        if (
+            self.memory_buffer is None
+            or self.memory_buffer.shape != self.memory.shape
+            or self.memory_buffer.dtype != dtype
+            or not self.memory_buffer.is_contiguous(memory_format=memory_format)
+        ):
+            self.memory_buffer = torch.empty(
+                self.memory.size(),
+                dtype=dtype,
+                pin_memory=True,
+                memory_format=memory_format,
+            )
+        stream = _get_memory_stream(self.memory.device)
+        stream.wait_stream(torch.cuda.current_stream(self.memory.device))
+        with torch.cuda.stream(stream):
+            # Cast on device, a dtype-changing copy to host would go through pageable memory.
+            memory = self.memory.to(dtype, memory_format=memory_format)
+            self.memory_buffer.copy_(memory, non_blocking=True)
+        self.memory.record_stream(stream)
+        self.memory_event = stream.record_event()
+        self.memory = self.memory_buffer
+
+    def plan_tiles(
         self,
         x,
         *,
@@ -78,88 +185,139 @@ class InflatedCausalConv3d(Conv3d):
         padding=(0, 0, 0, 0, 0, 0),
         prev_cache=None,
     ):
-        # Compatible with no limit.
-        if math.isinf(self.memory_limit):
-            if prev_cache is not None:
-                x = torch.cat([prev_cache, x], dim=split_dim - 1)
-            return super().forward(x)
-
+        """
+        Plan how `memory_limit_conv` splits the input. Returns None if it fits into the
+        memory limit, else the output shape and a list of tiles, each given as
+        (input slices, padding, output slices) with slices as (dim, start, length).
+        Only depends on shapes, so plans are cached per input geometry.
+        """
         # Compute tensor shape after concat & padding.
-        shape = torch.tensor(x.size())
+        shape = list(x.size())
         if prev_cache is not None:
             shape[split_dim - 1] += prev_cache.size(split_dim - 1)
-        shape[-3:] += torch.tensor(padding).view(3, 2).sum(-1).flip(0)
-        memory_occupy = shape.prod() * x.element_size() / 1024**3  # GiB
+        for i, (lpad, rpad) in enumerate(zip(padding[0::2], padding[1::2])):
+            shape[-1 - i] += lpad + rpad
+        memory_occupy = math.prod(shape) * x.element_size() / 1024**3  # GiB
         logger.debug(
             f"x:{(shape, x.dtype)} {memory_occupy:.3f}GiB "
             f"prev_cache:{prev_cache.shape if prev_cache is not None else None}"
         )
         if memory_occupy < self.memory_limit or split_dim == x.ndim:
-            if prev_cache is not None:
-                x = torch.cat([prev_cache, x], dim=split_dim - 1)
-            x = F.pad(x, padding, value=0.0)
-            with ignore_padding(self):
-                return super().forward(x)
+            return None
 
         logger.debug(
             f"Exceed memory limit {memory_occupy} > {self.memory_limit}, split dim {split_dim}"
         )
 
-        # Split input (& prev_cache).
-        num_splits = math.ceil(memory_occupy / self.memory_limit)
-        size_per_split = x.size(split_dim) // num_splits
-        split_sizes = [size_per_split] * (num_splits - 1)
-        split_sizes += [x.size(split_dim) - sum(split_sizes)]
+        # Split the remaining dims in output coordinates, in order,
+        # until a single tile (including its halo) fits into the memory limit.
+        output_shape = _conv_output_shape(self, shape)
+        strides = self.stride
+        kernel_sizes = [d * (k - 1) + 1 for k, d in zip(self.kernel_size, self.dilation)]
+        tile_ranges = []
+        for dim in range(split_dim, x.ndim):
+            output_len = output_shape[dim]
+            num_splits = 1
+            if memory_occupy >= self.memory_limit:
+                num_splits = min(math.ceil(memory_occupy / self.memory_limit), output_len)
+            size_per_split = output_len // num_splits
+            split_sizes = [size_per_split] * (num_splits - 1)
+            split_sizes += [output_len - sum(split_sizes)]
+            split_starts = [size_per_split * i for i in range(num_splits)]
+            tile_ranges.append(list(zip(split_starts, split_sizes)))
+
+            # The last tile is the largest one.
+            tile_len = (split_sizes[-1] - 1) * strides[dim - 2] + kernel_sizes[dim - 2]
+            memory_occupy = memory_occupy * tile_len / shape[dim]
+        logger.debug(f"Conv tiles: {[len(ranges) for ranges in tile_ranges]}")
+
+        tiles = []
+        for tile in itertools.product(*tile_ranges):
+            in_slices, out_slices, tile_padding = [], [], list(padding)
+            for dim, (out_start, out_len) in enumerate(tile, start=split_dim):
+                # Input range of this tile (with halo) in padded coordinates.
+                lpad_dim = (x.ndim - dim - 1) * 2
+                rpad_dim = lpad_dim + 1
+                lpad = padding[lpad_dim]
+                in_start = out_start * strides[dim - 2]
+                in_end = (out_start + out_len - 1) * strides[dim - 2] + kernel_sizes[dim - 2]
+
+                # Only boundary tiles need padding.
+                tile_padding[lpad_dim] = max(lpad - in_start, 0)
+                tile_padding[rpad_dim] = max(in_end - lpad - x.size(dim), 0)
+                start = max(in_start - lpad, 0)
+                length = min(in_end - lpad, x.size(dim)) - start
+                in_slices.append((dim, start, length))
+                out_slices.append((dim, out_start, out_len))
+            tiles.append((in_slices, tuple(tile_padding), out_slices))
+        return output_shape, tiles
 
-        x = list(x.split(split_sizes, dim=split_dim))
-        logger.debug(f"Conv inputs: {[inp.size() for inp in x]} {x[0].dtype}")
-        if prev_cache is not None:
-            prev_cache = list(prev_cache.split(split_sizes, dim=split_dim))
+    def memory_limit_conv(
+        self,
+        x,
+        *,
+        split_dim=3,
+        padding=(0, 0, 0, 0, 0, 0),
+        prev_cache=None,
+    ):
+        weight, bias = self.weight, self.bias
+        stride, dilation, groups = self.stride, self.dilation, self.groups
 
-        # Loop Fwd.
-        cache = None
-        for idx in range(len(x)):
-            # Concat prev cache from last dim
+        # Compatible with no limit.
+        if math.isinf(self.memory_limit):
             if prev_cache is not None:
-                x[idx] = torch.cat([prev_cache[idx], x[idx]], dim=split_dim - 1)
-
-            # Get padding pattern.
-            lpad_dim = (x[idx].ndim - split_dim - 1) * 2
-            rpad_dim = lpad_dim + 1
-            padding = list(padding)
-            padding[lpad_dim] = self.padding[split_dim - 2] if idx == 0 else 0
-            padding[rpad_dim] = self.padding[split_dim - 2] if idx == len(x) - 1 else 0
-            pad_len = padding[lpad_dim] + padding[rpad_dim]
-            padding = tuple(padding)
-
-            # Prepare cache for next slice (this dim).
-            next_cache = None
-            cache_len = cache.size(split_dim) if cache is not None else 0
-            next_catch_size = get_cache_size(
-                conv_module=self,
-                input_len=x[idx].size(split_dim) + cache_len,
-                pad_len=pad_len,
-                dim=split_dim - 2,
+                x = torch.cat([prev_cache, x], dim=split_dim - 1)
+            return F.conv3d(x, weight, bias, stride, self.padding, dilation, groups)
+
+        key = (
+            x.shape,
+            x.element_size(),
+            split_dim,
+            padding,
+            prev_cache.shape if prev_cache is not None else None,
+        )
+        if key not in self.tile_plans:
+            self.tile_plans[key] = self.plan_tiles(
+                x, split_dim=split_dim, padding=padding, prev_cache=prev_cache
             )
-            if next_catch_size != 0:
-                assert next_catch_size <= x[idx].size(split_dim)
-                next_cache = (
-                    x[idx].transpose(0, split_dim)[-next_catch_size:].transpose(0, split_dim)
-                )
+        plan = self.tile_plans[key]
+        if plan is None:
+            x = _cat_pad([x] if prev_cache is None else [prev_cache, x], split_dim - 1, padding)
+            return F.conv3d(x, weight, bias, stride, 0, dilation, groups)
 
-            # Recursive.
-            x[idx] = self.memory_limit_conv(
-                x[idx],
-                split_dim=split_dim + 1,
-                padding=padding,
-                prev_cache=cache,
+        # Loop Fwd.
+        output_shape, tiles = plan
+        out = None
+        for in_slices, tile_padding, out_slices in tiles:
+            x_tile, cache_tile = x, prev_cache
+            for dim, start, length in in_slices:
+                x_tile = x_tile.narrow(dim, start, length)
+                if cache_tile is not None:
+                    cache_tile = cache_tile.narrow(dim, start, length)
+
+            # Interior tiles without cache are passed to conv as views.
+            x_tile = _cat_pad(
+                [x_tile] if cache_tile is None else [cache_tile, x_tile],
+                split_dim - 1,
+                tile_padding,
             )
+            y = F.conv3d(x_tile, weight, bias, stride, 0, dilation, groups)
+
+            # Write this tile into the output (allocated once, in the dtype conv produces).
+            if out is None:
+                out = torch.empty(
+                    output_shape,
+                    dtype=y.dtype,
+                    device=y.device,
+                    memory_format=torch.channels_last_3d,
+                )
+            out_tile = out
+            for dim, start, length in out_slices:
+                out_tile = out_tile.narrow(dim, start, length)
+            out_tile.copy_(y)
 
-            # Update cache.
-            cache = next_cache
-
-        logger.debug(f"Conv outputs, concat(dim={split_dim}): {[d.size() for d in x]}")
-        return torch.cat(x, split_dim)
+        logger.debug(f"Conv outputs: {out.size()}")
+        return out
 
     def forward(
         self,
@@ -167,8 +325,12 @@ class InflatedCausalConv3d(Conv3d):
         memory_state: MemoryState = MemoryState.UNSET,
     ) -> Tensor:
         assert memory_state != MemoryState.UNSET
+        if self.memory_event is not None:
+            torch.cuda.current_stream(self.memory_event.device).wait_event(self.memory_event)
+            self.memory_event = None
         if memory_state != MemoryState.ACTIVE:
             self.memory = None
+            self.memory_buffer = None  # Don't keep page-locked host memory past a reset.
         if (
             math.isinf(self.memory_limit)
             and torch.is_tensor(input)
@@ -195,7 +357,7 @@ class InflatedCausalConv3d(Conv3d):
         ):
             self.memory = memory
             if self.memory_device == "cpu" and self.memory is not None:
-                self.memory = self.memory.to("cpu")
+                self._offload_memory()
         return super().forward(input)
 
     def slicing_forward(
@@ -222,6 +384,8 @@ class InflatedCausalConv3d(Conv3d):
         sp_group = get_sequence_parallel_group()
         send_dst = get_next_sequence_parallel_rank()
         recv_src = get_prev_sequence_parallel_rank()
+        memory_reqs = []
+        offload_memory = False
         if (
             memory_state in [MemoryState.INITIALIZING, MemoryState.ACTIVE]  # use_slicing
             and not self.training
@@ -234,25 +398,28 @@ class InflatedCausalConv3d(Conv3d):
                 cache = None
             assert cache_size <= input[-1].size(2)
             if sp_size == 1:
-                self.memory = input[-1][:, :, -cache_size:].detach().contiguous()
+                self.memory = input[-1][:, :, -cache_size:].detach()
+                if self.memory_device != "cpu":
+                    # Own a compact copy rather than a view keeping the whole slice alive,
+                    # the cpu offload makes its own copy.
+                    self.memory = self.memory.contiguous()
             else:
+                # Exchange memory asynchronously, overlapped with the conv below.
                 if sp_rank == sp_size - 1:
-                    dist.send(
-                        input[-1][:, :, -cache_size:].detach().contiguous(),
-                        send_dst,
-                        group=sp_group,
+                    memory_reqs.append(
+                        dist.isend(
+                            input[-1][:, :, -cache_size:].detach().contiguous(),
+                            send_dst,
+                            group=sp_group,
+                        )
                     )
                 if sp_rank == 0:
                     shape = list(input[0].size())
                     shape[2] = cache_size
-                    self.memory = torch.empty(
-                        *shape, device=input[0].device, dtype=input[0].dtype
-                    ).contiguous()
-                    dist.recv(self.memory, recv_src, group=sp_group)
-            if self.memory_device == "cpu" and self.memory is not None:
-                self.memory = self.memory.to("cpu")
+                    self.memory = torch.empty(*shape, device=input[0].device, dtype=input[0].dtype)
+                    memory_reqs.append(dist.irecv(self.memory, recv_src, group=sp_group))
+            offload_memory = self.memory_device == "cpu"
 
-        padding = tuple(x for x in reversed(self.padding) for _ in range(2))
         for i in range(len(input)):
             # Prepare cache for next input slice.
             next_cache = None
@@ -268,15 +435,30 @@ class InflatedCausalConv3d(Conv3d):
                 next_cache = input[i][:, :, -cache_size:]
 
             # Conv forward for this input slice.
-            input[i] = self.memory_limit_conv(
-                input[i],
-                padding=padding,
-                prev_cache=cache,
-            )
+            if self.training and torch.is_grad_enabled():
+                # Only keep the slice (& cache) for backward, not the padded conv tiles.
+                input[i] = torch.utils.checkpoint.checkpoint(
+                    self.memory_limit_conv,
+                    input[i],
+                    padding=self.slicing_padding,
+                    prev_cache=cache,
+                    use_reentrant=False,
+                )
+            else:
+                input[i] = self.memory_limit_conv(
+                    input[i],
+                    padding=self.slicing_padding,
+                    prev_cache=cache,
+                )
 
             # Update cache.
             cache = next_cache
 
+        for req in memory_reqs:
+            req.wait()
+        if offload_memory and self.memory is not None:
+            self._offload_memory()
+
         return input[0] if squeeze_out else input
 
     def tflops(self, args, kwargs, output) -> float:
@@ -326,25 +508,29 @@ def init_causal_conv3d(
     return InflatedCausalConv3d(*args, inflation_mode=inflation_mode, **kwargs)
 
 
+def _group_norm(x, num_groups, weight, bias, eps, dtype):
+    return F.group_norm(x, num_groups, weight, bias, eps).to(dtype)
+
+
 def causal_norm_wrapper(norm_layer: nn.Module, x: torch.Tensor) -> torch.Tensor:
     input_dtype = x.dtype
     if isinstance(norm_layer, (nn.LayerNorm, RMSNorm)):
         if x.ndim == 4:
-            x = rearrange(x, "b c h w -> b h w c")
+            x = x.permute(0, 2, 3, 1)
             x = norm_layer(x)
-            x = rearrange(x, "b h w c -> b c h w")
+            x = x.permute(0, 3, 1, 2)
             return x.to(input_dtype)
         if x.ndim == 5:
-            x = rearrange(x, "b c t h w -> b t h w c")
+            x = x.permute(0, 2, 3, 4, 1)
             x = norm_layer(x)
-            x = rearrange(x, "b t h w c -> b c t h w")
+            x = x.permute(0, 4, 1, 2, 3)
             return x.to(input_dtype)
     if isinstance(norm_layer, (nn.GroupNorm, nn.BatchNorm2d, nn.SyncBatchNorm)):
         if x.ndim <= 4:
             return norm_layer(x).to(input_dtype)
         if x.ndim == 5:
-            t = x.size(2)
-            x = rearrange(x, "b c t h w -> (b t) c h w")
+            b, c, t, h, w = x.size()
+            x = x.transpose(1, 2).reshape(b * t, c, h, w)
             memory_occupy = x.numel() * x.element_size() / 1024**3
             if isinstance(norm_layer, nn.GroupNorm) and memory_occupy > get_norm_limit():
                 num_chunks = min(4 if x.element_size() == 2 else 2, norm_layer.num_groups)
@@ -352,16 +538,28 @@ def causal_norm_wrapper(norm_layer: nn.Module, x: torch.Tensor) -> torch.Tensor:
                 assert norm_layer.num_groups % num_chunks == 0
                 num_groups_per_chunk = norm_layer.num_groups // num_chunks
 
-                x = list(x.chunk(num_chunks, dim=1))
-                weights = norm_layer.weight.chunk(num_chunks, dim=0)
-                biases = norm_layer.bias.chunk(num_chunks, dim=0)
-                for i, (w, b) in enumerate(zip(weights, biases)):
-                    x[i] = F.group_norm(x[i], num_groups_per_chunk, w, b, norm_layer.eps)
-                    x[i] = x[i].to(input_dtype)
-                x = torch.cat(x, dim=1)
+                # Write chunks into one output, only a single chunk result is alive at a time.
+                out = torch.empty_like(x)
+                chunk_size = x.size(1) // num_chunks
+                for i in range(num_chunks):
+                    chunk = x.narrow(1, i * chunk_size, chunk_size)
+                    out_chunk = out.narrow(1, i * chunk_size, chunk_size)
+                    weight = norm_layer.weight.narrow(0, i * chunk_size, chunk_size)
+                    bias = norm_layer.bias.narrow(0, i * chunk_size, chunk_size)
+                    args = (chunk, num_groups_per_chunk, weight, bias, norm_layer.eps, input_dtype)
+                    if torch.is_grad_enabled():
+                        # Recompute in backward rather than keeping the upcast chunk alive.
+                        out_chunk.copy_(
+                            torch.utils.checkpoint.checkpoint(
+                                _group_norm, *args, use_reentrant=False
+                            )
+                        )
+                    else:
+                        out_chunk.copy_(_group_norm(*args))
+                x = out
             else:
                 x = norm_layer(x)
-            x = rearrange(x, "(b t) c h w -> b c t h w", t=t)
+            x = x.reshape(b, t, c, h, w).transpose(1, 2)
             return x.to(input_dtype)
     raise NotImplementedError
 
@@ -389,9 +587,10 @@ def extend_head(tensor: Tensor, times: int = 2, memory: Optional[Tensor] = None)
     if times == 0:
         return tensor
     else:
-        tile_repeat = [1] * tensor.ndim
-        tile_repeat[2] = times
-        return torch.cat(tensors=(torch.tile(tensor[:, :, :1], tile_repeat), tensor), dim=2)
+        # Broadcast view of the first frame, only materialized once by cat.
+        head_shape = list(tensor.size())
+        head_shape[2] = times
+        return torch.cat(tensors=(tensor[:, :, :1].expand(head_shape), tensor), dim=2)
 
 
 def inflate_weight(weight_2d: torch.Tensor, weight_3d: torch.Tensor, inflation_mode: str):
@@ -407,7 +606,7 @@ def inflate_weight(weight_2d: torch.Tensor, weight_3d: torch.Tensor, inflation_m
     with torch.no_grad():
         if inflation_mode == "replicate":
             depth = weight_3d.size(2)
-            weight_3d.copy_(weight_2d.unsqueeze(2).repeat(1, 1, depth, 1, 1) / depth)
+            weight_3d.copy_(weight_2d.unsqueeze(2).expand(-1, -1, depth, -1, -1)).div_(depth)
         else:
             weight_3d.fill_(0.0)
             weight_3d[:, :, -1].copy_(weight_2d)
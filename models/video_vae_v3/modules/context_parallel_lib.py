@@ -12,6 +12,7 @@
 # // See the License for the specific language governing permissions and
 # // limitations under the License.
 
+from functools import lru_cache
 from typing import List
 import torch
 import torch.distributed as dist
@@ -94,18 +95,27 @@ def get_output_len(conv_module, input_len, pad_len, dim=0):
 
 
 def get_cache_size(conv_module, input_len, pad_len, dim=0):
-    dilated_kernerl_size = conv_module.dilation[dim] * (conv_module.kernel_size[dim] - 1) + 1
-    output_len = (input_len + pad_len - dilated_kernerl_size) // conv_module.stride[dim] + 1
-    remain_len = (
-        input_len + pad_len - ((output_len - 1) * conv_module.stride[dim] + dilated_kernerl_size)
+    return _get_cache_size(
+        conv_module.kernel_size[dim],
+        conv_module.stride[dim],
+        conv_module.dilation[dim],
+        input_len,
+        pad_len,
     )
-    overlap_len = dilated_kernerl_size - conv_module.stride[dim]
+
+
+@lru_cache(maxsize=1024)
+def _get_cache_size(kernel_size, stride, dilation, input_len, pad_len):
+    dilated_kernerl_size = dilation * (kernel_size - 1) + 1
+    output_len = (input_len + pad_len - dilated_kernerl_size) // stride + 1
+    remain_len = input_len + pad_len - ((output_len - 1) * stride + dilated_kernerl_size)
+    overlap_len = dilated_kernerl_size - stride
     cache_len = overlap_len + remain_len  # >= 0
     logger.debug(
         f"I:{input_len}, "
         f"P:{pad_len}, "
-        f"K:{conv_module.kernel_size[dim]}, "
-        f"S:{conv_module.stride[dim]}, "
+        f"K:{kernel_size}, "
+        f"S:{stride}, "
         f"O:{output_len}, "
         f"Cache:{cache_len}"
     )
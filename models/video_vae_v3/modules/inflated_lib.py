@@ -14,10 +14,8 @@
 
 from enum import Enum
 from typing import Optional
-import numpy as np
 import torch
 from diffusers.models.normalization import RMSNorm
-from einops import rearrange
 from torch import Tensor, nn
 
 from common.logger import get_logger
@@ -41,23 +39,23 @@ class MemoryState(Enum):
 def causal_norm_wrapper(norm_layer: nn.Module, x: torch.Tensor) -> torch.Tensor:
     if isinstance(norm_layer, (nn.LayerNorm, RMSNorm)):
         if x.ndim == 4:
-            x = rearrange(x, "b c h w -> b h w c")
+            x = x.permute(0, 2, 3, 1)
             x = norm_layer(x)
-            x = rearrange(x, "b h w c -> b c h w")
+            x = x.permute(0, 3, 1, 2)
             return x
         if x.ndim == 5:
-            x = rearrange(x, "b c t h w -> b t h w c")
+            x = x.permute(0, 2, 3, 4, 1)
             x = norm_layer(x)
-            x = rearrange(x, "b t h w c -> b c t h w")
+            x = x.permute(0, 4, 1, 2, 3)
             return x
     if isinstance(norm_layer, (nn.GroupNorm, nn.BatchNorm2d, nn.SyncBatchNorm)):
         if x.ndim <= 4:
             return norm_layer(x)
         if x.ndim == 5:
-            t = x.size(2)
-            x = rearrange(x, "b c t h w -> (b t) c h w")
+            b, c, t, h, w = x.size()
+            x = x.transpose(1, 2).reshape(b * t, c, h, w)
             x = norm_layer(x)
-            x = rearrange(x, "(b t) c h w -> b c t h w", t=t)
+            x = x.reshape(b, t, c, h, w).transpose(1, 2)
             return x
     raise NotImplementedError
 
@@ -85,9 +83,10 @@ def extend_head(
     if memory is not None:
         return torch.cat((memory.to(tensor), tensor), dim=2)
     else:
-        tile_repeat = np.ones(tensor.ndim).astype(int)
-        tile_repeat[2] = times
-        return torch.cat(tensors=(torch.tile(tensor[:, :, :1], list(tile_repeat)), tensor), dim=2)
+        # Broadcast view of the first frame, only materialized once by cat.
+        head_shape = list(tensor.size())
+        head_shape[2] = times
+        return torch.cat(tensors=(tensor[:, :, :1].expand(head_shape), tensor), dim=2)
 
 
 def inflate_weight(weight_2d: torch.Tensor, weight_3d: torch.Tensor, inflation_mode: str):
@@ -103,7 +102,7 @@ def inflate_weight(weight_2d: torch.Tensor, weight_3d: torch.Tensor, inflation_m
     with torch.no_grad():
         if inflation_mode == "replicate":
             depth = weight_3d.size(2)
-            weight_3d.copy_(weight_2d.unsqueeze(2).repeat(1, 1, depth, 1, 1) / depth)
+            weight_3d.copy_(weight_2d.unsqueeze(2).expand(-1, -1, depth, -1, -1)).div_(depth)
         else:
             weight_3d.fill_(0.0)
             weight_3d[:, :, -1].copy_(weight_2d)
@@ -878,6 +878,7 @@ class VideoAutoencoderKL(nn.Module):
         *,
         split_size: Optional[int],
         memory_device: _memory_device_t,
+        memory_dtype: Optional[str] = None,
     ):
         assert (
             split_size is None or memory_device is not None
@@ -891,6 +892,7 @@ class VideoAutoencoderKL(nn.Module):
         for module in self.modules():
             if isinstance(module, InflatedCausalConv3d):
                 module.set_memory_device(memory_device)
+                module.set_memory_dtype(memory_dtype)
 
     def set_memory_limit(self, conv_max_mem: Optional[float], norm_max_mem: Optional[float]):
         set_norm_limit(norm_max_mem)
@@ -939,6 +941,7 @@ class VideoAutoencoderKLWrapper(VideoAutoencoderKL):
         *,
         split_size: Optional[int],
         memory_device: Optional[Literal["cpu", "same"]],
+        memory_dtype: Optional[str] = None,
     ):
         assert (
             split_size is None or memory_device is not None
@@ -952,4 +955,5 @@ class VideoAutoencoderKLWrapper(VideoAutoencoderKL):
             self.slicing_latent_min_size = split_size // self.temporal_downsample_factor
         for module in self.modules():
             if isinstance(module, InflatedCausalConv3d):
-                module.set_memory_device(memory_device)
\ No newline at end of file
+                module.set_memory_device(memory_device)
+                module.set_memory_dtype(memory_dtype)
\ No newline at end of file